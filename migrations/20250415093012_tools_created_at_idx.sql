@@ -0,0 +1,5 @@
+-- migrate:up transaction:false
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tools_user_id_created_at_tool_id ON tools (user_id, created_at DESC, tool_id DESC);
+
+-- migrate:down
+DROP INDEX IF EXISTS tools_user_id_created_at_tool_id;
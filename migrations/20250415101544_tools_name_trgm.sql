@@ -0,0 +1,6 @@
+-- migrate:up transaction:false
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tools_name_trgm ON tools USING gin (lower(name) gin_trgm_ops);
+
+-- migrate:down
+DROP INDEX IF EXISTS tools_name_trgm;
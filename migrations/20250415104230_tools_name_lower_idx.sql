@@ -0,0 +1,5 @@
+-- migrate:up transaction:false
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tools_name_lower ON tools (lower(name));
+
+-- migrate:down
+DROP INDEX IF EXISTS tools_name_lower;
@@ -0,0 +1,5 @@
+-- migrate:up transaction:false
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tools_user_id_name_lower ON tools (user_id, lower(name));
+
+-- migrate:down
+DROP INDEX IF EXISTS tools_user_id_name_lower;
@@ -298,7 +298,8 @@ async def update_agent(
 
     # X change?
     x_fields = ["x_user_id", "x_access_token", "x_refresh_token", "x_token_expires_at"]
-    if agent.x_username != args.x_username:
+    x_changed = agent.x_username != args.x_username
+    if x_changed:
         if not args.x_username:
             agent.x_username = None
         else:
@@ -326,6 +327,8 @@ async def update_agent(
     if not args.x_invoke_filter:
         agent.x_invoke_filter = None
     await db.commit()
+    if x_changed:
+        await settings.redis_client.delete(f"xtok:{agent.agent_id}")
     await db.refresh(agent)
     return agent
 
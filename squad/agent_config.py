@@ -32,7 +32,7 @@ class Settings(BaseSettings):
     default_tts_voice: str = os.getenv("DEFAULT_TTS_VOICE", "af_sky")
     default_tts_slug: str = os.getenv("DEFAULT_TTS_SLUG", "chutes-kokoro-82m")
     squad_api_base_url: str = os.getenv("SQUAD_API_BASE_URL", "http://127.0.0.1:8000")
-    x_live_mode: bool = os.getenv("X_LIVE_MODE", "false") == "true"
+    x_live_mode: bool = os.getenv("X_LIVE_MODE", "true").lower() != "false"
     timeout: int = int(os.getenv("EXECUTION_TIMEOUT", "5400"))
     execution_proxy: Optional[str] = os.getenv("EXECUTION_PROXY")
 
@@ -4,42 +4,58 @@ Simple aiohttp session manager.
 
 import asyncio
 import aiohttp
+import orjson as json
 from contextlib import asynccontextmanager
 
 
+def _json_serialize(obj) -> str:
+    return json.dumps(obj).decode()
+
+
 class SessionManager:
     def __init__(
-        self, base_url: str = None, limit: int = 100, ttl_dns_cache: int = 300, headers: dict = {}
+        self,
+        base_url: str = None,
+        limit: int = 100,
+        ttl_dns_cache: int = 300,
+        headers: dict = {},
+        raise_for_status: bool = True,
     ):
-        self._session = None
+        # aiohttp sessions are bound to the loop they were created on, so keep one per loop
+        # (sync tool code may drive several loops in one process).
+        self._sessions = {}
         self._base_url = base_url
         self._limit = limit
         self._ttl_dns_cache = ttl_dns_cache
         self._headers = headers
-        self._lock = asyncio.Lock()
+        self._raise_for_status = raise_for_status
 
     @asynccontextmanager
     async def get_session(self) -> aiohttp.ClientSession:
         """
         Get or create an aiohttp session.
         """
-        async with self._lock:
-            if self._session is None or self._session.closed:
-                self._session = aiohttp.ClientSession(
-                    base_url=self._base_url,
-                    connector=aiohttp.TCPConnector(
-                        limit=self._limit, ttl_dns_cache=self._ttl_dns_cache, force_close=False
-                    ),
-                    headers=self._headers,
-                    raise_for_status=True,
-                )
-        yield self._session
+        # No await between the check and the assignment, so no lock is needed.
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            for stale in [other for other in self._sessions if other.is_closed()]:
+                del self._sessions[stale]
+            session = self._sessions[loop] = aiohttp.ClientSession(
+                base_url=self._base_url,
+                connector=aiohttp.TCPConnector(
+                    limit=self._limit, ttl_dns_cache=self._ttl_dns_cache, force_close=False
+                ),
+                headers=self._headers,
+                raise_for_status=self._raise_for_status,
+                json_serialize=_json_serialize,
+            )
+        yield session
 
     async def close(self):
         """
-        Close the session.
+        Close the session (for the current loop).
         """
-        async with self._lock:
-            if self._session and not self._session.closed:
-                await self._session.close()
-                self._session = None
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session and not session.closed:
+            await session.close()
@@ -0,0 +1,71 @@
+"""
+Coalesce concurrent single-item calls into batched calls.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class AsyncBatcher:
+    def __init__(
+        self,
+        handler: Callable[[list], Awaitable[list]],
+        max_size: int = 32,
+        max_wait: float = 0.01,
+    ):
+        self._handler = handler
+        self._max_size = max_size
+        self._max_wait = max_wait
+        self._queue = None
+        self._worker = None
+        self._dispatching = set()
+
+    async def submit(self, item) -> Any:
+        """
+        Queue an item for the next batch and wait for its individual result.
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        """
+        Collect up to max_size items (waiting at most max_wait seconds after the
+        first item), then dispatch them as a single batch.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch):
+        """
+        Call the handler with the batch and fan the results back out by index.
+        """
+        items = [item for item, _ in batch]
+        try:
+            results = await self._handler(items)
+            if len(results) != len(items):
+                raise ValueError(f"Expected {len(items)} batch results, got {len(results)}")
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
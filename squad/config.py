@@ -54,6 +54,7 @@ class Settings(BaseSettings):
     )
     db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "256"))
     db_overflow: int = int(os.getenv("DB_OVERFLOW", "32"))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
     # AES secret
     aes_secret: str = os.getenv(
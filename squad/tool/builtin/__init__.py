@@ -30,3 +30,31 @@ from squad.tool.builtin.byok import byok_tool
 from squad.tool.builtin.agent_caller import agent_caller_tool
 from squad.tool.builtin.data_universe import DataUniverseSearcher
 from squad.tool.builtin.apex_search import ApexWebSearcher
+
+# Template name -> builtin tool class (or tool factory function).
+REGISTRY = {
+    "DangerousDynamo": DangerousDynamo,
+    "TranscribeTool": TranscribeTool,
+    "ContentTyper": ContentTyper,
+    "WebsiteFetcher": WebsiteFetcher,
+    "WebsiteScreenshotter": WebsiteScreenshotter,
+    "Downloader": Downloader,
+    "WebSearcher": WebSearcher,
+    "memory_searcher": memory_searcher,
+    "memory_creator": memory_creator,
+    "memory_eraser": memory_eraser,
+    "XTweeter": XTweeter,
+    "XFollower": XFollower,
+    "XLiker": XLiker,
+    "XRetweeter": XRetweeter,
+    "XQuoteTweeter": XQuoteTweeter,
+    "XSearcher": XSearcher,
+    "llm_tool": llm_tool,
+    "vlm_tool": vlm_tool,
+    "tts_tool": tts_tool,
+    "image_tool": image_tool,
+    "byok_tool": byok_tool,
+    "agent_caller_tool": agent_caller_tool,
+    "DataUniverseSearcher": DataUniverseSearcher,
+    "ApexWebSearcher": ApexWebSearcher,
+}
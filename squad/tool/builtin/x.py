@@ -2,73 +2,179 @@
 X/twitter tools.
 """
 
+import io
 import os
 import requests
+from requests.adapters import HTTPAdapter
 import asyncio
+import threading
+from pydantic import TypeAdapter
 from smolagents import Tool
 from squad.util import rerank
+from squad.ttlcache import TTLCache
 from squad.data.schemas import XSearchParams
 from squad.storage.x import Tweet
 from squad.agent_config import settings
 
+# Shared keep-alive pool for all X tool calls to the squad API.
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# Decode + validate search results in a single pydantic-core pass.
+_TWEETS = TypeAdapter(list[Tweet])
+
+_URL_TPL = "URL: https://x.com/i/status/%s"
+
+# The search kwargs schema is static, so render the inputs spec (and its multi-KB
+# description) exactly once.
+_X_SEARCH_INPUTS = {
+    "query": {
+        "type": "string",
+        "description": "search query string to use when performing the search",
+    },
+    "top_n": {
+        "type": "integer",
+        "nullable": True,
+        "description": "perform reranking to return only the top top_n related tweets",
+    },
+    "kwargs": {
+        "type": "object",
+        "description": (
+            "Optional search flags/settings to augment, limit, or filter results. "
+            "Treat this as normal python kwargs, not a dict. "
+            "Supported kwargs are the following (but do not include 'query'): "
+            f"{XSearchParams.model_json_schema()}\n"
+            "Be sure to pass `has=['photo']` when searching for images."
+        ),
+    },
+}
+
+# Max seconds to wait on the reranker before using the unranked results.
+RERANK_TIMEOUT = 2.0
+
+# Recent write action outcomes, so blind agent retries don't re-post the same action.
+ACTION_CACHE_TTL = 300
+ACTION_CACHE_SIZE = 4096
+_ACTION_CACHE = TTLCache(ACTION_CACHE_TTL, ACTION_CACHE_SIZE)
+
+# Resolved once at import, write tools pick their forward implementation from it (live unless
+# X_LIVE_MODE=false is set explicitly).
+_LIVE = settings.x_live_mode
+
+_WORKER_LOOP = None
+_WORKER_LOOP_LOCK = threading.Lock()
+
+
+def _worker_loop():
+    """
+    Get (starting it on first use) the persistent loop used when a loop is already running.
+    """
+    global _WORKER_LOOP
+    with _WORKER_LOOP_LOCK:
+        if _WORKER_LOOP is None:
+            _WORKER_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_WORKER_LOOP.run_forever, daemon=True).start()
+    return _WORKER_LOOP
+
+
+def _run_sync(coro):
+    """
+    Run a coroutine to completion from the (synchronous) smolagents forward call.
+
+    smolagents has no async tool hook, so when there is no running loop we use the
+    thread's loop (set up by the agent template), otherwise the coroutine is handed to
+    a long-lived worker loop rather than failing with "loop already running". Reusing
+    one worker loop keeps its (loop-bound) aiohttp sessions alive across calls.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.get_event_loop_policy().get_event_loop().run_until_complete(coro)
+    return asyncio.run_coroutine_threadsafe(coro, _worker_loop()).result()
+
+
+class _XWriteTool(Tool):
+    """
+    Base for tools that mutate state on X, swapping in the mock forward when not live.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not _LIVE:
+            self.forward = self._forward_mock
+
+    def _post_action(self, key, path: str, payload: dict, message: str):
+        """
+        POST an (idempotent) action, treating conflicts (already liked, etc.) as success.
+        """
+        key = (self.name,) + key
+        if (cached := _ACTION_CACHE.get(key)) is not None:
+            return cached
+        response = _SESSION.post(
+            f"{settings.squad_api_base_url}{path}",
+            json=payload,
+            headers={
+                "Authorization": settings.authorization,
+            },
+        )
+        if response.status_code != 409:
+            response.raise_for_status()
+        result = f"{message}: {response.text}"
+        _ACTION_CACHE.set(key, result)
+        return result
+
 
 class XSearcher(Tool):
     name = "x_search"
     description = "Tool for performing searches on X (formerly twitter) to find information and media that might be related to a topic."
-    inputs = {
-        "query": {
-            "type": "string",
-            "description": "search query string to use when performing the search",
-        },
-        "top_n": {
-            "type": "integer",
-            "nullable": True,
-            "description": "perform reranking to return only the top top_n related tweets",
-        },
-        "kwargs": {
-            "type": "object",
-            "description": (
-                "Optional search flags/settings to augment, limit, or filter results. "
-                "Treat this as normal python kwargs, not a dict. "
-                "Supported kwargs are the following (but do not include 'query'): "
-                f"{XSearchParams.model_json_schema()}\n"
-                "Be sure to pass `has=['photo']` when searching for images."
-            ),
-        },
-    }
+    inputs = _X_SEARCH_INPUTS
     output_type = "string"
 
     def forward(self, query: str, top_n: int = 5, **kwargs):
         params = {"text": query}
         params.update(kwargs)
-        raw_response = requests.post(
+        raw_response = _SESSION.post(
             f"{settings.squad_api_base_url}/data/x/search",
             json=params,
             headers={
                 "Authorization": settings.authorization,
             },
         )
-        tweets = raw_response.json()
+        tweets = _TWEETS.validate_json(raw_response.content)
         if tweets:
-            tweets = [Tweet(**item) for item in raw_response.json()]
+            # Search can return the same tweet more than once, don't format/rerank dupes.
+            tweets = {tweet.id: tweet for tweet in tweets}.values()
             singular_items = []
             for tweet in tweets:
-                singular_items.append(
-                    "\n".join(
-                        [f"{key}: {value}" for key, value in tweet.model_dump().items()]
-                        + [f"URL: https://x.com/i/status/{tweet.id}"]
-                    )
-                )
+                lines = [f"{key}: {value}" for key, value in tweet.model_dump().items()]
+                lines.append(_URL_TPL % tweet.id)
+                singular_items.append("\n".join(lines))
             return_docs = singular_items
-            if top_n:
-                loop = asyncio.get_event_loop()
-                return_docs = loop.run_until_complete(
-                    rerank(query, singular_items, top_n=top_n, auth=settings.authorization)
+            if top_n and len(singular_items) > top_n:
+                # The timeout covers only the reranker request (not local tokenization), and
+                # rerank falls back to the BM25-prefiltered order when it fails.
+                return_docs = _run_sync(
+                    rerank(
+                        query,
+                        singular_items,
+                        top_n=top_n,
+                        auth=settings.authorization,
+                        timeout=RERANK_TIMEOUT,
+                    )
                 )
-            return "\n---\n".join(return_docs)
+                if isinstance(return_docs, str):
+                    # rerank returns the already-joined documents on success.
+                    return return_docs
+            buf = io.StringIO()
+            for idx, doc in enumerate(return_docs):
+                if idx:
+                    buf.write("\n---\n")
+                buf.write(doc)
+            return buf.getvalue()
 
 
-class XTweeter(Tool):
+class XTweeter(_XWriteTool):
     name = "x_tweet"
     description = "Tool for creating an X post (aka tweet)."
     inputs = {
@@ -89,7 +195,13 @@ class XTweeter(Tool):
     }
     output_type = "string"
 
+    def _forward_mock(self, text: str, in_reply_to: str = None, media: str = None):
+        return f"Successfully tweeted (X live mode disabled): {text}"
+
     def forward(self, text: str, in_reply_to: str = None, media: str = None):
+        cache_key = (self.name, text, in_reply_to, media)
+        if (cached := _ACTION_CACHE.get(cache_key)) is not None:
+            return cached
         payload = {
             "text": text,
         }
@@ -111,7 +223,7 @@ class XTweeter(Tool):
                 try:
                     with open(media, "rb") as f:
                         files = {"file": (os.path.basename(media), f)}
-                        media_response = requests.post(
+                        media_response = _SESSION.post(
                             media_upload_url, headers=media_headers, files=files
                         )
                     media_response.raise_for_status()
@@ -157,10 +269,12 @@ class XTweeter(Tool):
                 raise Exception(f"Invalid media provided, {reason}!")
 
         request_args["json"] = payload
-        response = requests.post(**request_args)
+        response = _SESSION.post(**request_args)
         try:
             response.raise_for_status()
-            return f"Successfully tweeted: {response.text}"
+            result = f"Successfully tweeted: {response.text}"
+            _ACTION_CACHE.set(cache_key, result)
+            return result
         except requests.exceptions.HTTPError as err:
             print(f"HTTP Error occurred posting tweet: {err}")
             print(f"Status Code: {err.response.status_code}")
@@ -176,7 +290,7 @@ class XTweeter(Tool):
             raise e
 
 
-class XFollower(Tool):
+class XFollower(_XWriteTool):
     name = "x_follow"
     description = "Tool for following another user on X/twitter."
     inputs = {
@@ -187,19 +301,19 @@ class XFollower(Tool):
     }
     output_type = "string"
 
+    def _forward_mock(self, user_id: str):
+        return f"Successfully followed {user_id=} (X live mode disabled)"
+
     def forward(self, user_id: str):
-        response = requests.post(
-            f"{settings.squad_api_base_url}/x/follow",
-            json={"user_id": user_id},
-            headers={
-                "Authorization": settings.authorization,
-            },
+        return self._post_action(
+            (user_id,),
+            "/x/follow",
+            {"user_id": user_id},
+            f"Successfully followed {user_id=}",
         )
-        response.raise_for_status()
-        return f"Successfully followed {user_id=}: {response.text}"
 
 
-class XLiker(Tool):
+class XLiker(_XWriteTool):
     name = "x_like"
     description = "Tool to 'like' a post on X/twitter."
     inputs = {
@@ -210,19 +324,19 @@ class XLiker(Tool):
     }
     output_type = "string"
 
+    def _forward_mock(self, tweet_id: str):
+        return f"Successfully liked {tweet_id=} (X live mode disabled)"
+
     def forward(self, tweet_id: str):
-        response = requests.post(
-            f"{settings.squad_api_base_url}/x/like",
-            json={"tweet_id": tweet_id},
-            headers={
-                "Authorization": settings.authorization,
-            },
+        return self._post_action(
+            (tweet_id,),
+            "/x/like",
+            {"tweet_id": tweet_id},
+            f"Successfully liked {tweet_id=}",
         )
-        response.raise_for_status()
-        return f"Successfully liked {tweet_id=}: {response.text}"
 
 
-class XRetweeter(Tool):
+class XRetweeter(_XWriteTool):
     name = "x_retweet"
     description = "Tool for re-tweeting a tweet, with no additional text/comment just a re-tweet."
     inputs = {
@@ -233,19 +347,19 @@ class XRetweeter(Tool):
     }
     output_type = "string"
 
+    def _forward_mock(self, tweet_id: str):
+        return f"Successfully retweeted {tweet_id=} (X live mode disabled)"
+
     def forward(self, tweet_id: str):
-        response = requests.post(
-            f"{settings.squad_api_base_url}/x/retweet",
-            json={"tweet_id": tweet_id},
-            headers={
-                "Authorization": settings.authorization,
-            },
+        return self._post_action(
+            (tweet_id,),
+            "/x/retweet",
+            {"tweet_id": tweet_id},
+            f"Successfully retweeted {tweet_id=}",
         )
-        response.raise_for_status()
-        return f"Successfully retweeted {tweet_id=}: {response.text}"
 
 
-class XQuoteTweeter(Tool):
+class XQuoteTweeter(_XWriteTool):
     name = "x_quote_tweet"
     description = "Tool for re-tweeting a tweet with additional comments/text."
     inputs = {
@@ -260,13 +374,13 @@ class XQuoteTweeter(Tool):
     }
     output_type = "string"
 
+    def _forward_mock(self, tweet_id: str, text: str):
+        return f"Successfully quote tweeted {tweet_id=} (X live mode disabled)"
+
     def forward(self, tweet_id: str, text: str):
-        response = requests.post(
-            f"{settings.squad_api_base_url}/x/like",
-            json={"tweet_id": tweet_id, "text": text},
-            headers={
-                "Authorization": settings.authorization,
-            },
+        return self._post_action(
+            (tweet_id, text),
+            "/x/quote",
+            {"tweet_id": tweet_id, "text": text},
+            f"Successfully quote tweeted {tweet_id=}",
         )
-        response.raise_for_status()
-        return f"Successfully quote tweeted {tweet_id=}: {response.text}"
@@ -2,11 +2,12 @@
 Schema for tool creation args.
 """
 
-import types
 from typing import Optional
 from pydantic import BaseModel, Field
 import squad.tool.builtin as builtin
 
+_TEMPLATE_NAMES = frozenset(builtin.REGISTRY)
+
 
 class ToolArgs(BaseModel):
     name: str = Field(
@@ -23,13 +24,7 @@ class ToolArgs(BaseModel):
     )
     template: Optional[str] = Field(
         None,
-        enum=[
-            f
-            for f in dir(builtin)
-            if f != "Tool"
-            and not f.startswith("_")
-            and not isinstance(getattr(builtin, f, None), types.ModuleType)
-        ],
+        enum=sorted(_TEMPLATE_NAMES),
         description="Template, when using built-in tools",
     )
     public: Optional[bool] = Field(True, description="Allow others to use this tool as well")
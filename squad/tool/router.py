@@ -3,16 +3,20 @@ Router to handle tools.
 """
 
 import re
-from pydantic import BaseModel, Field
+import asyncio
+import orjson as json
+import pybase64 as base64
+from datetime import datetime
+from pydantic import BaseModel, Field, TypeAdapter
 from loguru import logger
 import squad.tool.builtin as builtin_tools
 from typing import Optional, Any
-from sqlalchemy import select, or_, func, exists
+from sqlalchemy import select, insert, delete, literal, lambda_stmt, or_, func, exists, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException, status
 from squad.auth import get_current_user
 from squad.util import validate_logo
-from squad.database import get_db_session
+from squad.database import get_db_session, get_session, generate_uuid
 from squad.pagination import PaginatedResponse
 from squad.tool.schemas import Tool
 from squad.tool.requests import ToolArgs
@@ -28,6 +32,11 @@ from squad.tool.validation import (
 
 router = APIRouter()
 
+TOOL_LIST_ADAPTER = TypeAdapter(list[ToolResponse])
+# Listing only needs the response fields, so skip ORM hydration entirely.
+TOOL_LIST_COLUMNS = [getattr(Tool, field) for field in ToolResponse.model_fields]
+VALID_NAME = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*\Z")
+
 TOOL_MAP = {
     "vlm_tool": VLMArgs,
     "llm_tool": LLMArgs,
@@ -52,34 +61,73 @@ class ToolUpdateArgs(BaseModel):
 
 class PaginatedTools(PaginatedResponse):
     items: list[ToolResponse]
+    next_cursor: Optional[str] = None
+
+
+def _encode_cursor(row) -> str:
+    """
+    Opaque keyset pagination cursor, pointing at the last tool (row) of a page.
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps([row["created_at"].isoformat(), row["tool_id"]])
+    ).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, tool_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created_at), tool_id
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor.",
+        )
 
 
 async def _load_tool(db, tool_id, user_id):
-    query = select(Tool).where(Tool.tool_id == tool_id)
+    # Lambda statements cache the compiled SQL, only the bound values change per call.
+    query = lambda_stmt(lambda: select(Tool).where(Tool.tool_id == tool_id))
     if user_id:
-        query = query.where(or_(Tool.user_id == user_id, Tool.public.is_(True)))
+        query += lambda s: s.where(or_(Tool.user_id == user_id, Tool.public.is_(True)))
     else:
-        query = query.where(Tool.public.is_(True))
-    return (await db.execute(query)).unique().scalar_one_or_none()
+        query += lambda s: s.where(Tool.public.is_(True))
+    return (await db.execute(query)).scalar_one_or_none()
 
 
-@router.get("/options")
-async def list_options():
-    model_dump = ToolArgs.model_json_schema()
+async def _load_own_tool(db, tool_id, user_id):
+    query = lambda_stmt(
+        lambda: select(Tool).where(Tool.tool_id == tool_id, Tool.user_id == user_id)
+    )
+    return (await db.execute(query)).scalar_one_or_none()
+
+
+def _template_options():
+    """
+    Build the (static) per-template tool_args schemas.
+    """
+    memory_schema = MemoryArgs.model_json_schema()
+    arg_schemas = {key: arg_class.model_json_schema() for key, arg_class in TOOL_MAP.items()}
     template_options = {}
-    for key in dir(builtin_tools):
-        obj = getattr(builtin_tools, key)
-        if isinstance(obj, type) and obj != builtin_tools.Tool:
+    for key, obj in builtin_tools.REGISTRY.items():
+        if isinstance(obj, type):
             template_options[key] = None
-        elif obj != builtin_tools.Tool:
-            if key.startswith("memory_"):
-                template_options[key] = MemoryArgs.model_json_schema()
-            elif (arg_class := TOOL_MAP.get(key)) is not None:
-                template_options[key] = arg_class.model_json_schema()
-    return {
-        "request_schema": model_dump,
-        "tool_args": template_options,
-    }
+        elif key.startswith("memory_"):
+            template_options[key] = memory_schema
+        elif (schema := arg_schemas.get(key)) is not None:
+            template_options[key] = schema
+    return template_options
+
+
+# Schemas never change at runtime, so generate them once at import.
+TOOL_OPTIONS = {
+    "request_schema": ToolArgs.model_json_schema(),
+    "tool_args": _template_options(),
+}
+
+
+@router.get("/options")
+async def list_options():
+    return TOOL_OPTIONS
 
 
 @router.get("", response_model=PaginatedTools)
@@ -89,42 +137,49 @@ async def list_tools(
     search: Optional[str] = None,
     limit: Optional[int] = 10,
     page: Optional[int] = 0,
+    cursor: Optional[str] = None,
     user: Any = Depends(get_current_user(raise_not_found=False)),
 ):
     user_id = user.user_id if user else None
-    query = select(Tool)
+    filters = []
     if search:
-        query = query.where(Tool.name.ilike(f"%{search}%"))
+        filters.append(func.lower(Tool.name).ilike(f"%{search.lower()}%"))
     if include_public:
         if user:
-            query = query.where(or_(Tool.user_id == user_id, Tool.public.is_(True)))
+            filters.append(or_(Tool.user_id == user_id, Tool.public.is_(True)))
         else:
-            query = query.where(Tool.public.is_(True))
+            filters.append(Tool.public.is_(True))
     elif not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="You must authenticate to see your own private tools.",
         )
     else:
-        query = query.where(Tool.user_id == user_id)
+        filters.append(Tool.user_id == user_id)
+    query = select(*TOOL_LIST_COLUMNS).where(*filters)
 
-    # Perform a count.
-    total_query = select(func.count()).select_from(query.subquery())
-    total_result = await db.execute(total_query)
-    total = total_result.scalar() or 0
+    # Perform the count (on a separate session/connection) concurrently with the page query.
+    total_query = select(func.count(Tool.tool_id)).where(*filters)
 
-    # Pagination.
-    query = (
-        query.order_by(Tool.created_at.desc())
-        .offset((page or 0) * (limit or 10))
-        .limit((limit or 10))
-    )
-    result = await db.execute(query)
+    async def _count():
+        async with get_session() as session:
+            return (await session.execute(total_query)).scalar() or 0
+
+    # Pagination, either seek-based via cursor (constant cost per page) or via offset.
+    query = query.order_by(Tool.created_at.desc(), Tool.tool_id.desc()).limit(limit or 10)
+    if cursor:
+        created_at, tool_id = _decode_cursor(cursor)
+        query = query.where(tuple_(Tool.created_at, Tool.tool_id) < tuple_(created_at, tool_id))
+    else:
+        query = query.offset((page or 0) * (limit or 10))
+    total, result = await asyncio.gather(_count(), db.execute(query))
+    items = result.mappings().all()
     return {
         "total": total,
         "page": page,
         "limit": limit,
-        "items": [ToolResponse.from_orm(item) for item in result.unique().scalars().all()],
+        "items": TOOL_LIST_ADAPTER.validate_python(items),
+        "next_cursor": _encode_cursor(items[-1]) if len(items) == (limit or 10) else None,
     }
 
 
@@ -133,9 +188,9 @@ async def check_tool_name(
     name: str,
     db: AsyncSession = Depends(get_db_session),
 ):
-    if not re.match(r"^[a-zA-Z_][a-zA-Z0-9_]*$", name):
+    if not VALID_NAME.match(name):
         return {"valid": False, "available": False}
-    query = select(exists().where(Tool.name.ilike(name)))
+    query = select(exists().where(func.lower(Tool.name) == name.lower()))
     tool_exists = await db.scalar(query)
     if tool_exists:
         return {"available": False, "valid": True}
@@ -163,15 +218,6 @@ async def create_tool(
     db: AsyncSession = Depends(get_db_session),
     user: Any = Depends(get_current_user()),
 ):
-    count = (
-        await db.execute(select(func.count()).select_from(Tool).where(Tool.user_id == user.user_id))
-    ).scalar_one()
-    if count >= user.limits.max_tools:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=f"You have reached or exceeded the maximum number of tools for your account tier: {count}",
-        )
-
     args.tool_args["tool_name"] = args.name
     if not args.tool_args.get("tool_description"):
         args.tool_args["tool_description"] = args.description
@@ -183,15 +229,12 @@ async def create_tool(
     if args.template:
         args.code = None
 
-    # Check the logo.
-    await validate_logo(args.logo_id)
-
+    # Check the logo and template args (independent, so concurrently).
     validator = ToolValidator(db, args, user)
-    await validator.validate()
-    tool = None
+    await asyncio.gather(validate_logo(args.logo_id), validator.validate())
     try:
-        tool = Tool(**args.model_dump())
-        tool.user_id = user.user_id
+        # Constructing the ORM object runs the column validators, e.g. for custom code.
+        Tool(**args.model_dump())
     except ValueError as exc:
         import traceback
 
@@ -201,9 +244,37 @@ async def create_tool(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(exc),
         )
-    db.add(tool)
+
+    # Insert only if the user is under their tool limit, in a single statement. Under READ
+    # COMMITTED two concurrent creates could both pass the count, so serialize per user with
+    # a transaction-scoped advisory lock (released on commit/rollback).
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(user.user_id))))
+    values = {
+        **args.model_dump(),
+        "tool_id": generate_uuid(),
+        "user_id": user.user_id,
+    }
+    tool_count = (
+        select(func.count(Tool.tool_id)).where(Tool.user_id == user.user_id).scalar_subquery()
+    )
+    table = Tool.__table__
+    query = (
+        insert(table)
+        .from_select(
+            list(values),
+            select(
+                *[literal(value, type_=table.c[key].type) for key, value in values.items()]
+            ).where(tool_count < user.limits.max_tools),
+        )
+        .returning(*table.columns)
+    )
+    tool = (await db.execute(query)).mappings().one_or_none()
+    if not tool:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"You have reached or exceeded the maximum number of tools for your account tier: {user.limits.max_tools}",
+        )
     await db.commit()
-    await db.refresh(tool)
     return tool
 
 
@@ -214,8 +285,7 @@ async def update_tool(
     db: AsyncSession = Depends(get_db_session),
     user: Any = Depends(get_current_user()),
 ):
-    tool = await _load_tool(db, tool_id, user.user_id)
-    if not tool or tool.user_id != user.user_id:
+    if (tool := await _load_own_tool(db, tool_id, user.user_id)) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Tool {tool_id} not found, or does not belong to you.",
@@ -226,24 +296,27 @@ async def update_tool(
         if "description" in update_data and "tool_description" not in update_data["tool_args"]:
             update_data["tool_args"]["tool_description"] = update_data["description"]
 
-    # Check the logo.
-    await validate_logo(args.logo_id)
-
-    validator_args = ToolArgs(
-        name=tool.name,
-        description=update_data.get("description", tool.description),
-        template=tool.template,
-        code=args.code,
-        public=args.public,
-        logo_id=args.logo_id,
-        tool_args=update_data["tool_args"],
-    )
-    validator = ToolValidator(db, validator_args, user)
-    await validator.validate()
+    # Template args are the only thing ToolValidator checks (code is checked by the ORM
+    # validator on assignment), so e.g. toggling public/logo/description skips it.
+    if "tool_args" in update_data:
+        validator_args = ToolArgs(
+            name=tool.name,
+            description=update_data.get("description", tool.description),
+            template=tool.template,
+            code=args.code,
+            public=args.public,
+            logo_id=args.logo_id,
+            tool_args=update_data["tool_args"],
+        )
+        validator = ToolValidator(db, validator_args, user)
+        await asyncio.gather(validate_logo(args.logo_id), validator.validate())
+    elif args.logo_id:
+        await validate_logo(args.logo_id)
     for key, value in update_data.items():
         setattr(tool, key, value)
+    # No server-side defaults change on update and expire_on_commit is off, so the
+    # in-memory tool is already current; no refresh round trip needed.
     await db.commit()
-    await db.refresh(tool)
     return tool
 
 
@@ -253,12 +326,15 @@ async def delete_tool(
     db: AsyncSession = Depends(get_db_session),
     user: Any = Depends(get_current_user()),
 ):
-    tool = await _load_tool(db, tool_id, user.user_id)
-    if not tool or tool.user_id != user.user_id:
+    result = await db.execute(
+        delete(Tool)
+        .where(Tool.tool_id == tool_id, Tool.user_id == user.user_id)
+        .returning(Tool.tool_id)
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Tool {tool_id} not found, or does not belong to you.",
         )
-    await db.delete(tool)
     await db.commit()
     return {"deleted": True, "tool_id": tool_id}
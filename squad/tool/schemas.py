@@ -3,6 +3,7 @@ ORM definitions/methods for tools.
 """
 
 import ast
+from functools import lru_cache
 from fastapi import HTTPException, status
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -19,6 +20,55 @@ from squad.database import Base, generate_uuid
 from squad.agent_tool.schemas import agent_tools
 
 
+@lru_cache(maxsize=512)
+def _validate_tool_code(code: str) -> None:
+    """
+    Syntax/structure checks for custom tool code, cached since the same code is
+    re-validated on every ORM assignment (only successful validations are cached).
+    """
+    try:
+        tree = ast.parse(code)
+        tool_classes = [item for item in tree.body if isinstance(item, ast.ClassDef)]
+        if len(tool_classes) != 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Code must define exactly one tool class!",
+            )
+
+        # Check class inheritance
+        tool_class = tool_classes[0]
+        has_tool_base = False
+        for base in tool_class.bases:
+            if isinstance(base, ast.Name) and base.id == "Tool":
+                has_tool_base = True
+                break
+            elif isinstance(base, ast.Attribute):
+                if isinstance(base.value, ast.Name):
+                    if base.value.id == "smolagents" and base.attr == "Tool":
+                        has_tool_base = True
+                        break
+        if not has_tool_base:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Tool class must inherit from smolagents.Tool",
+            )
+
+        # Check if code compiles, reusing the already parsed tree.
+        compile(tree, "<string>", "exec")
+    except SyntaxError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Code syntax error: {str(e)}",
+        )
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unexpected validation error: {e}",
+        )
+
+
 class Tool(Base):
     __tablename__ = "tools"
     tool_id = Column(String, primary_key=True, default=generate_uuid)
@@ -46,45 +96,5 @@ class Tool(Base):
         """
         if code is None:
             return code
-        try:
-            tree = ast.parse(code)
-            tool_classes = [item for item in tree.body if isinstance(item, ast.ClassDef)]
-            if len(tool_classes) != 1:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Code must define exactly one tool class!",
-                )
-
-            # Check class inheritance
-            tool_class = tool_classes[0]
-            has_tool_base = False
-            for base in tool_class.bases:
-                if isinstance(base, ast.Name) and base.id == "Tool":
-                    has_tool_base = True
-                    break
-                elif isinstance(base, ast.Attribute):
-                    if isinstance(base.value, ast.Name):
-                        if base.value.id == "smolagents" and base.attr == "Tool":
-                            has_tool_base = True
-                            break
-            if not has_tool_base:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Tool class must inherit from smolagents.Tool",
-                )
-
-            # Check if code compiles
-            compile(code, "<string>", "exec")
-        except SyntaxError as e:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Code syntax error: {str(e)}",
-            )
-        except Exception as e:
-            if isinstance(e, HTTPException):
-                raise
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Unexpected validation error: {e}",
-            )
+        _validate_tool_code(code)
         return code
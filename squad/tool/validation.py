@@ -2,11 +2,13 @@
 (Minimal) validation code for tool creation.
 """
 
-import aiohttp
+import time
+import orjson as json
+from async_lru import alru_cache
 from loguru import logger
-from sqlalchemy import select
-from typing import Optional
-from pydantic import BaseModel, Field, ValidationError, constr
+from sqlalchemy import select, exists, func
+from typing import Annotated, Optional
+from pydantic import BaseModel, Field, StringConstraints, TypeAdapter, ValidationError
 from fastapi import HTTPException, status
 from squad.tool.schemas import Tool
 from smolagents import Tool as STool
@@ -14,18 +16,28 @@ import squad.util as util
 from squad.auth import generate_auth_token
 import squad.tool.builtin as builtin
 from squad.config import settings
+from squad.aiosession import SessionManager
+from squad.ttlcache import TTLCache
 from squad.database import get_session
 from squad.secret.schemas import BYOKSecret
 from sqlalchemy import or_
 
 
+IDENT_PATTERN = r"^[a-zA-Z_][a-zA-Z0-9_]*$"
+SLUG_PATTERN = r"^[a-z0-9-]+$"
+METHOD_PATTERN = r"^(post|put|get|head|patch|delete)$"
+Ident = Annotated[str, StringConstraints(pattern=IDENT_PATTERN)]
+Slug = Annotated[str, StringConstraints(pattern=SLUG_PATTERN)]
+Method = Annotated[str, StringConstraints(pattern=METHOD_PATTERN)]
+
+
 class BaseArgs(BaseModel):
     model_config = {"none_as_default": True}
 
 
 class ImageArgs(BaseArgs):
     model: str
-    tool_name: Optional[str] = constr(pattern=r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+    tool_name: Optional[Ident] = None
     tool_description: Optional[str] = Field(
         None, description="Tool description provided to agent LLM"
     )
@@ -47,7 +59,7 @@ class ImageArgs(BaseArgs):
 
 class LLMArgs(BaseArgs):
     model: str
-    tool_name: Optional[str] = constr(pattern=r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+    tool_name: Optional[Ident] = None
     tool_description: Optional[str] = Field(
         None, description="Tool description provided to agent LLM"
     )
@@ -61,8 +73,8 @@ class LLMArgs(BaseArgs):
 
 class TTSArgs(BaseArgs):
     voice: str
-    slug: constr(pattern="^[a-z0-9-]+$") = "chutes-kokoro-82m"
-    tool_name: Optional[str] = constr(pattern=r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+    slug: Slug = "chutes-kokoro-82m"
+    tool_name: Optional[Ident] = None
     tool_description: Optional[str] = Field(
         None, description="Tool description provided to agent LLM"
     )
@@ -72,7 +84,7 @@ class MemoryArgs(BaseArgs):
     static_session_id: Optional[str] = Field(
         None, description="Optional static session ID to segment memories"
     )
-    tool_name: Optional[str] = constr(pattern=r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+    tool_name: Optional[Ident] = None
     tool_description: Optional[str] = Field(
         None, description="Tool description provided to agent LLM"
     )
@@ -86,20 +98,54 @@ class AgentCallerArgs(BaseArgs):
     tool_description: Optional[str] = Field(
         None, description="Tool description provided to agent LLM"
     )
-    tool_name: str = constr(pattern=r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+    tool_name: Ident
     public: Optional[bool] = True
 
 
 class BYOKArgs(BaseArgs):
     upstream_url: str
     secret_name: str
-    method: Optional[str] = constr(pattern=r"^(post|put|get|head|patch|delete)$")
-    tool_name: Optional[str] = constr(pattern=r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+    method: Optional[Method] = None
+    tool_name: Optional[Ident] = None
     tool_description: Optional[str] = Field(
         None, description="Tool description provided to agent LLM"
     )
 
 
+SQUAD_SM = SessionManager(base_url=settings.squad_api_base_url)
+
+# Validators are compiled once here rather than per request.
+_IMAGE_ADAPTER = TypeAdapter(ImageArgs)
+_LLM_ADAPTER = TypeAdapter(LLMArgs)
+_TTS_ADAPTER = TypeAdapter(TTSArgs)
+_MEMORY_ADAPTER = TypeAdapter(MemoryArgs)
+_AGENT_ADAPTER = TypeAdapter(AgentCallerArgs)
+_BYOK_ADAPTER = TypeAdapter(BYOKArgs)
+
+
+BYOK_CACHE_TTL = 30
+
+# Chutes confirmed to exist (with the expected template), per user; hits only.
+CHUTE_CACHE_TTL = 60
+CHUTE_CACHE_SIZE = 4096
+_CHUTE_CACHE = TTLCache(CHUTE_CACHE_TTL, CHUTE_CACHE_SIZE)
+
+
+@alru_cache(maxsize=1024)
+async def _secret_exists(user_id: str, secret_name: str, runtime: float = 0.0) -> bool:
+    """
+    Check if a BYOK secret is visible to the user (cached per runtime bucket).
+    """
+    query = select(
+        exists().where(
+            BYOKSecret.name == secret_name,
+            or_(BYOKSecret.user_id == user_id, BYOKSecret.public.is_(True)),
+        )
+    )
+    async with get_session() as session:
+        return bool(await session.scalar(query))
+
+
 class ToolValidator:
     def __init__(self, db, args, user):
         self.db = db
@@ -110,18 +156,13 @@ class ToolValidator:
         """
         Check for tools with the same name, no duplicates per user.
         """
-        existing = (
-            (
-                await self.db.execute(
-                    select(Tool).where(
-                        Tool.name.ilike(self.args.name), Tool.user_id == self.user.user_id
-                    )
-                )
+        query = select(
+            exists().where(
+                Tool.user_id == self.user.user_id,
+                func.lower(Tool.name) == self.args.name.lower(),
             )
-            .unique()
-            .scalar_one_or_none()
         )
-        if existing:
+        if await self.db.scalar(query):
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"Tool with name {self.args.name} already exists for user {self.user.username}",
@@ -131,11 +172,15 @@ class ToolValidator:
         """
         Check if a chute exists and has the endpoint expected.
         """
+        cache_key = (self.user.user_id, name, template)
+        if _CHUTE_CACHE.get(cache_key):
+            return
         try:
             async with util.chutes_get(f"/chutes/{name}", self.user) as resp:
-                chute = await resp.json()
+                chute = json.loads(await resp.read())
                 assert chute.get("standard_template") == template
                 assert chute.get("name") == name
+            _CHUTE_CACHE.set(cache_key, True)
         except Exception as exc:
             logger.info(f"Failed to fetch chute: {self.user=} {name=} {exc}")
             raise HTTPException(
@@ -149,7 +194,7 @@ class ToolValidator:
         """
         await self.check_chute_exists(self.args.tool_args.get("model"), "diffusion")
         try:
-            ImageArgs(**self.args.tool_args)
+            _IMAGE_ADAPTER.validate_python(self.args.tool_args)
         except ValidationError as exc:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -162,35 +207,29 @@ class ToolValidator:
         """
         await self.check_chute_exists(self.args.tool_args.get("model"), "vllm")
         try:
-            LLMArgs(**self.args.tool_args)
+            _LLM_ADAPTER.validate_python(self.args.tool_args)
         except ValidationError as exc:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Validation error: {exc}",
             )
 
-    validate_vlm_tool = validate_llm_tool
-
     async def validate_tts_tool(self):
         """
         Validate text-to-speech tools.
         """
         try:
-            tts_args = TTSArgs(**self.args.tool_args)
-            exists = False
+            tts_args = _TTS_ADAPTER.validate_python(self.args.tool_args)
             async with util.chutes_get(
                 "/chutes/", self.user, params={"include_public": "true", "slug": tts_args.slug}
             ) as resp:
-                data = await resp.json()
-                for chute in data.get("items", []):
-                    cords = data.get("cord_refs", {}).get(chute["cord_ref_id"])
-                    for cord in cords:
-                        if cord.get("path") == "/speak":
-                            exists = True
-                            break
-                    if exists:
-                        break
-            if not exists:
+                data = json.loads(await resp.read())
+            cord_refs = data.get("cord_refs", {})
+            if not any(
+                cord.get("path") == "/speak"
+                for chute in data.get("items", [])
+                for cord in cord_refs.get(chute["cord_ref_id"]) or []
+            ):
                 raise Exception("Chute not found with {tts_args.slug=}")
         except Exception as exc:
             raise HTTPException(
@@ -203,13 +242,12 @@ class ToolValidator:
         Validate agent caller tools.
         """
         try:
-            agent_args = AgentCallerArgs(**self.args.tool_args)
-            async with aiohttp.ClientSession() as session:
+            agent_args = _AGENT_ADAPTER.validate_python(self.args.tool_args)
+            async with SQUAD_SM.get_session() as session:
                 async with session.get(
-                    f"{settings.squad_api_base_url}/agents/{agent_args.agent}",
+                    f"/agents/{agent_args.agent}",
                     headers={"Authorization": f"Bearer {generate_auth_token(self.user.user_id)}"},
-                ) as resp:
-                    resp.raise_for_status()
+                ):
                     return
         except Exception:
             ...
@@ -224,29 +262,16 @@ class ToolValidator:
         Validate "bring your own key" request tools.
         """
         try:
-            byok_args = BYOKArgs(**self.args.tool_args)
-            async with get_session() as session:
-                secret = (
-                    (
-                        await session.execute(
-                            select(BYOKSecret).where(
-                                BYOKSecret.name == byok_args.secret_name,
-                                or_(
-                                    BYOKSecret.user_id == self.user.user_id,
-                                    BYOKSecret.public.is_(True),
-                                ),
-                            )
-                        )
-                    )
-                    .unique()
-                    .scalar_one_or_none()
+            byok_args = _BYOK_ADAPTER.validate_python(self.args.tool_args)
+            runtime = time.time() // BYOK_CACHE_TTL
+            if not await _secret_exists(self.user.user_id, byok_args.secret_name, runtime):
+                # Don't cache misses, the secret may be created right after this.
+                _secret_exists.cache_invalidate(self.user.user_id, byok_args.secret_name, runtime)
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid BYOK tool: secret {byok_args.secret_name} not found",
                 )
-                if not secret:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Invalid BYOK tool: secret {byok_args.secret_name} not found",
-                    )
-                return
+            return
         except Exception:
             ...
 
@@ -260,16 +285,25 @@ class ToolValidator:
         Validate memory tools.
         """
         try:
-            MemoryArgs(**self.args.tool_args)
+            _MEMORY_ADAPTER.validate_python(self.args.tool_args)
         except ValidationError as exc:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Validation error: {exc}",
             )
 
-    validate_memory_searcher = validate_memory_tool
-    validate_memory_creator = validate_memory_tool
-    validate_memory_eraser = validate_memory_tool
+    _DISPATCH = {
+        "image_tool": validate_image_tool,
+        "llm_tool": validate_llm_tool,
+        "vlm_tool": validate_llm_tool,
+        "tts_tool": validate_tts_tool,
+        "agent_caller_tool": validate_agent_caller_tool,
+        "byok_tool": validate_byok_tool,
+        "memory_tool": validate_memory_tool,
+        "memory_searcher": validate_memory_tool,
+        "memory_creator": validate_memory_tool,
+        "memory_eraser": validate_memory_tool,
+    }
 
     async def validate(self):
         """
@@ -277,8 +311,8 @@ class ToolValidator:
         """
         if not self.args.template:
             return
-        if hasattr(self, f"validate_{self.args.template}"):
-            await getattr(self, f"validate_{self.args.template}")()
+        if (validator := self._DISPATCH.get(self.args.template)) is not None:
+            await validator(self)
             return
         tool = getattr(builtin, self.args.template, None)
         if not tool or not issubclass(tool, STool):
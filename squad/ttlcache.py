@@ -0,0 +1,30 @@
+"""
+Small bounded in-process cache with per-entry expiry.
+"""
+
+import time
+
+
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int = 4096):
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._data = {}
+
+    def get(self, key, default=None):
+        """
+        Get the value for key if present and not yet expired.
+        """
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return default
+
+    def set(self, key, value):
+        """
+        Store a value for ttl seconds, evicting the oldest entry once full.
+        """
+        self._data.pop(key, None)
+        if len(self._data) >= self._maxsize:
+            self._data.pop(next(iter(self._data)))
+        self._data[key] = (time.monotonic() + self._ttl, value)
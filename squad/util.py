@@ -3,25 +3,31 @@ Utilities and helpers.
 """
 
 import os
+import math
+import heapq
+import asyncio
 import hashlib
 import time
 import secrets
+import threading
 import datetime
-import requests
 import traceback
-import aiohttp
+import orjson as json
 import pybase64 as base64
 from fastapi import HTTPException, status
-from functools import lru_cache
 from loguru import logger
+from collections import Counter, OrderedDict
 from contextlib import asynccontextmanager
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
 from sqlalchemy import text
 from squad.database import get_session
 from squad.config import settings
 from squad.aiosession import SessionManager
+from squad.batcher import AsyncBatcher
+from squad.ttlcache import TTLCache
 from squad.auth import generate_auth_token
 
 
@@ -31,23 +37,68 @@ NSFW_SM = SessionManager(
 HATE_SM = SessionManager(
     base_url="https://chutes-hate-speech-detector.chutes.ai",
 )
-TOKENIZER = {}
+RERANK_SM = SessionManager(
+    base_url="https://chutes-baai-bge-reranker-large.chutes.ai",
+)
+LOGO_SM = SessionManager(
+    base_url="https://logos.chutes.ai",
+)
+MAX_LOGO_BYTES = 5 * 1024 * 1024
+_TOKENIZER = None
+_TOKENIZER_LOCK = threading.Lock()
+# Document token budget for the reranker (475 including the leading special token).
+RERANK_MAX_TOKENS = 474
+TRUNCATE_CACHE_SIZE = 4096
+# Max candidates (per requested result) sent to the remote reranker.
+RERANK_PREFILTER_FACTOR = 4
+_TRUNCATE_CACHE = OrderedDict()
+_AES_KEY = bytes.fromhex(settings.aes_secret)
+_AEAD = AESGCM(_AES_KEY)
+_BACKEND = default_backend()
 
 
-@lru_cache(maxsize=1)
-def tokenizer():
-    import transformers
+def _load_tokenizer():
+    """
+    Load the reranker tokenizer (once), only needed by processes that rerank.
+    """
+    global _TOKENIZER
+    with _TOKENIZER_LOCK:
+        if _TOKENIZER is None:
+            import transformers
+
+            _TOKENIZER = transformers.AutoTokenizer.from_pretrained(
+                os.path.join(os.path.dirname(__file__), "..", "bge-reranker-large"),
+                use_fast=True,
+            )
+    return _TOKENIZER
+
+
+# Signed JWTs are reused briefly, they remain valid long after the cache TTL.
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 4096
+_TOKEN_CACHE = TTLCache(TOKEN_CACHE_TTL, TOKEN_CACHE_SIZE)
+
+
+def _auth_header(user_id) -> str:
+    """
+    Get a (recently signed) authorization header for the user.
+    """
+    if (cached := _TOKEN_CACHE.get(user_id)) is not None:
+        return cached
+    header = f"Bearer {generate_auth_token(user_id)}"
+    _TOKEN_CACHE.set(user_id, header)
+    return header
 
-    if not TOKENIZER:
-        TOKENIZER["t"] = transformers.AutoTokenizer.from_pretrained(
-            os.path.join(os.path.dirname(__file__), "..", "bge-reranker-large")
-        )
-    return TOKENIZER["t"]
+
+# Service (default user) authorization header, regenerated one minute before expiry.
+_CHUTES_TOKEN = [None, 0.0]
 
 
 def get_chutes_token():
-    token = generate_auth_token(settings.default_user_id, duration_minutes=5)
-    return f"Bearer {token}"
+    if time.monotonic() > _CHUTES_TOKEN[1]:
+        token = generate_auth_token(settings.default_user_id, duration_minutes=5)
+        _CHUTES_TOKEN[:] = [f"Bearer {token}", time.monotonic() + 240]
+    return _CHUTES_TOKEN[0]
 
 
 @asynccontextmanager
@@ -58,7 +109,7 @@ async def chutes_get(path, user, **kwargs):
     async with settings.chutes_sm.get_session() as session:
         if "headers" not in kwargs:
             kwargs["headers"] = {}
-        kwargs["headers"]["Authorization"] = f"Bearer {generate_auth_token(user.user_id)}"
+        kwargs["headers"]["Authorization"] = _auth_header(user.user_id)
         async with session.get(path, **kwargs) as response:
             yield response
 
@@ -68,62 +119,110 @@ async def chutes_post(path, user, payload, **kwargs):
     """
     Perform POST request to chutes API as user.
     """
-    kwargs["json"] = payload
+    kwargs["data"] = json.dumps(payload)
     async with settings.chutes_sm.get_session() as session:
         if "headers" not in kwargs:
             kwargs["headers"] = {}
-        kwargs["headers"]["Authorization"] = f"Bearer {generate_auth_token(user.user_id)}"
+        kwargs["headers"]["Authorization"] = _auth_header(user.user_id)
+        kwargs["headers"]["Content-Type"] = "application/json"
         async with session.post(path, **kwargs) as response:
             yield response
 
 
-async def encrypt(secret: str, secret_type: str = "x") -> bytes:
+def _seal(secret: str) -> bytes:
     """
-    Encrypt a secret.
+    Encrypt a secret (app-side layer), as nonce || ciphertext.
+    """
+    nonce = secrets.token_bytes(12)
+    return nonce + _AEAD.encrypt(nonce, secret.encode(), None)
+
+
+def _split_cipher_blob(blob: bytes) -> tuple[bytes, bytes]:
+    """
+    Split a (legacy) AES-CBC payload into IV and ciphertext, supporting both the
+    hex "iv::::ciphertext" string format and raw iv || ciphertext bytes.
+    """
+    if len(blob) > 36 and blob[32:36] == b"::::":
+        try:
+            iv, ciphertext = blob.decode().split("::::")
+            return bytes.fromhex(iv), bytes.fromhex(ciphertext)
+        except ValueError:
+            pass
+    return blob[:16], blob[16:]
+
+
+def _unpkcs7(data: bytes) -> bytes:
+    """
+    Strip (and validate) PKCS7 padding for 16-byte blocks.
+    """
+    pad = data[-1] if data else 0
+    if not 1 <= pad <= 16 or data[-pad:] != bytes((pad,)) * pad:
+        raise ValueError("Invalid padding bytes.")
+    return data[:-pad]
+
+
+def _unseal(blob: bytes) -> str:
+    """
+    Decrypt the app-side layer of a secret.
+    """
+    try:
+        return _AEAD.decrypt(blob[:12], blob[12:], None).decode("utf-8")
+    except InvalidTag:
+        # Secrets stored before the switch to AES-GCM use AES-CBC.
+        iv, ciphertext = _split_cipher_blob(blob)
+    decryptor = Cipher(algorithms.AES(_AES_KEY), modes.CBC(iv), backend=_BACKEND).decryptor()
+    return _unpkcs7(decryptor.update(ciphertext) + decryptor.finalize()).decode("utf-8")
+
+
+async def encrypt_many(values: list[str], secret_type: str = "x") -> list[str]:
+    """
+    Encrypt multiple secrets in a single DB round trip, preserving order.
     """
-    padder = padding.PKCS7(128).padder()
-    iv = secrets.token_bytes(16)
-    cipher = Cipher(
-        algorithms.AES(bytes.fromhex(settings.aes_secret)),
-        modes.CBC(iv),
-        backend=default_backend(),
-    )
-    padded_data = padder.update(secret.encode()) + padder.finalize()
-    encryptor = cipher.encryptor()
-    encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
     async with get_session() as session:
         query = text(
-            "SELECT pgp_sym_encrypt(:data, (SELECT key FROM secrets WHERE id = :secret_type)) AS encrypted_data"
+            "SELECT pgp_sym_encrypt_bytea(t.data, s.key) AS encrypted_data "
+            "FROM unnest(CAST(:data AS bytea[])) WITH ORDINALITY AS t(data, idx), secrets s "
+            "WHERE s.id = :secret_type ORDER BY t.idx"
         )
-        cipher_str = f"{iv.hex()}::::{encrypted_data.hex()}"
-        result = await session.execute(query, {"data": cipher_str, "secret_type": secret_type})
-        row = result.first()
-        return row.encrypted_data.hex()
+        result = await session.execute(
+            query, {"data": [_seal(value) for value in values], "secret_type": secret_type}
+        )
+        return [row.encrypted_data.hex() for row in result]
 
 
-async def decrypt(encrypted_secret: str, secret_type: str = "x") -> str:
+async def decrypt_many(encrypted_values: list[str], secret_type: str = "x") -> list[str]:
     """
-    Decrypt a payment wallet secret.
+    Decrypt multiple secrets in a single DB round trip, preserving order.
     """
-    encrypted_secret = bytes.fromhex(encrypted_secret)
     async with get_session() as session:
+        query = text(
+            "SELECT pgp_sym_decrypt_bytea(t.data, s.key) AS decrypted_data "
+            "FROM unnest(CAST(:data AS bytea[])) WITH ORDINALITY AS t(data, idx), secrets s "
+            "WHERE s.id = :secret_type ORDER BY t.idx"
+        )
         result = await session.execute(
-            text(
-                "SELECT pgp_sym_decrypt(:encrypted_data, (SELECT key FROM secrets WHERE id = :secret_type)) AS decrypted_data"
-            ),
-            {"encrypted_data": encrypted_secret, "secret_type": secret_type},
+            query,
+            {
+                "data": [bytes.fromhex(value) for value in encrypted_values],
+                "secret_type": secret_type,
+            },
         )
-        iv, ciphertext = result.first().decrypted_data.split("::::")
-    cipher = Cipher(
-        algorithms.AES(bytes.fromhex(settings.aes_secret)),
-        modes.CBC(bytes.fromhex(iv)),
-        backend=default_backend(),
-    )
-    unpadder = padding.PKCS7(128).unpadder()
-    decryptor = cipher.decryptor()
-    decrypted_data = decryptor.update(bytes.fromhex(ciphertext)) + decryptor.finalize()
-    unpadded_data = unpadder.update(decrypted_data) + unpadder.finalize()
-    return unpadded_data.decode("utf-8")
+        blobs = [row.decrypted_data for row in result]
+    return [_unseal(blob) for blob in blobs]
+
+
+async def encrypt(secret: str, secret_type: str = "x") -> bytes:
+    """
+    Encrypt a secret.
+    """
+    return (await encrypt_many([secret], secret_type))[0]
+
+
+async def decrypt(encrypted_secret: str, secret_type: str = "x") -> str:
+    """
+    Decrypt a payment wallet secret.
+    """
+    return (await decrypt_many([encrypted_secret], secret_type))[0]
 
 
 async def rate_limit(rate_key, limit, window, incr_by: int = 1) -> bool:
@@ -132,7 +231,19 @@ async def rate_limit(rate_key, limit, window, incr_by: int = 1) -> bool:
     """
     now = int(time.time())
     suffix = now - (now % window)
-    cache_key = ("squad:rate:" + hashlib.md5(f"{rate_key}:{suffix}".encode()).hexdigest()).encode()
+    if (
+        len(rate_key) < 200
+        and rate_key.isascii()
+        and rate_key.isprintable()
+        and " " not in rate_key
+    ):
+        # Already a valid memcache key, no need to hash it.
+        cache_key = f"squad:rate:{rate_key}:{suffix}".encode()
+    else:
+        cache_key = (
+            "squad:rate:"
+            + hashlib.blake2b(f"{rate_key}:{suffix}".encode(), digest_size=16).hexdigest()
+        ).encode()
     try:
         count = 0
         if incr_by:
@@ -159,55 +270,112 @@ async def rate_limit(rate_key, limit, window, incr_by: int = 1) -> bool:
     return False
 
 
+async def _predict_hate_speech(texts: list[str]) -> list[dict]:
+    """
+    Classify a batch of texts with the hate speech detector.
+    """
+    async with HATE_SM.get_session() as session:
+        async with session.post(
+            "/predict", headers={"Authorization": get_chutes_token()}, json={"texts": texts}
+        ) as resp:
+            return json.loads(await resp.read())
+
+
+# Concurrent checks share a single classifier request.
+HATE_BATCHER = AsyncBatcher(_predict_hate_speech)
+
+
 async def contains_hate_speech(texts: list[str]):
     """
     Check if text has hate speach.
     """
     try:
-        async with HATE_SM.get_session() as session:
-            async with session.post(
-                "/predict", headers={"Authorization": get_chutes_token()}, json={"texts": texts}
-            ) as resp:
-                result = await resp.json()
-                for idx in range(len(result)):
-                    item = result[idx]
-                    if item.get("label") == "hate speech":
-                        logger.warning(f"Detected hate speech: {item} -> {texts[idx]}")
-                        return True
-                logger.info(f"No hate speech detected: {result}")
+        result = await asyncio.gather(*[HATE_BATCHER.submit(text) for text in texts])
+        hit = next(
+            (idx for idx, item in enumerate(result) if item.get("label") == "hate speech"), None
+        )
+        if hit is not None:
+            logger.warning(f"Detected hate speech: {result[hit]} -> {texts[hit]}")
+            return True
+        logger.info(f"No hate speech detected: {result}")
     except Exception as exc:
         logger.warning(f"Error checking hate speech content: {exc}")
     return False
 
 
-async def rerank(query, texts: list[str], top_n: int = 3, auth: str = None):
+def _bm25_top(query: str, texts: list[str], keep: int, k1: float = 1.5, b: float = 0.75):
+    """
+    Indices of the (up to) keep texts best matching the query by BM25, best first.
+    """
+    terms = set(query.lower().split())
+    docs = [Counter(text.lower().split()) for text in texts]
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = (sum(lengths) / len(docs)) or 1.0
+    idf = {}
+    for term in terms:
+        df = sum(1 for doc in docs if term in doc)
+        idf[term] = math.log((len(docs) - df + 0.5) / (df + 0.5) + 1)
+    scores = []
+    for doc, length in zip(docs, lengths):
+        norm = k1 * (1 - b + b * length / avg_length)
+        scores.append(sum(idf[t] * doc[t] * (k1 + 1) / (doc[t] + norm) for t in terms if t in doc))
+    return heapq.nlargest(keep, range(len(docs)), key=scores.__getitem__)
+
+
+async def rerank(query, texts: list[str], top_n: int = 3, auth: str = None, timeout: float = None):
     """
     Rerank the input documents based on the query to return only top_n results.
+    The optional timeout applies to the reranker request only, not the local prep.
     """
     if not texts or len(texts) <= top_n:
         return texts
-    rerank_docs = []
-    for item in texts:
-        tokens = tokenizer().encode(item)
-        if len(tokens) > 475:
-            tokens = tokens[:475]
-            rerank_docs.append(tokenizer().decode(tokens, skip_special_tokens=True))
+    # Cheap local BM25 prefilter, so only the most promising candidates are sent out.
+    if len(texts) > RERANK_PREFILTER_FACTOR * top_n:
+        texts = [texts[idx] for idx in _bm25_top(query, texts, RERANK_PREFILTER_FACTOR * top_n)]
+    # Tokenize (with truncation) in one batch call, and cut the truncated docs at the
+    # character offset of their last kept token, so there's no decode round trip.
+    # Docs this short can't reach the token limit, so they skip tokenization.
+    # Previously truncated docs (e.g. same results, different query) come from cache.
+    rerank_docs = list(texts)
+    long_idx = []
+    for idx, item in enumerate(texts):
+        if len(item) < RERANK_MAX_TOKENS // 2:
+            continue
+        if (truncated := _TRUNCATE_CACHE.get(item)) is not None:
+            _TRUNCATE_CACHE.move_to_end(item)
+            rerank_docs[idx] = truncated
         else:
-            rerank_docs.append(item)
+            long_idx.append(idx)
+    if long_idx:
+        tokenizer = _TOKENIZER or _load_tokenizer()
+        encoded = tokenizer(
+            [texts[idx] for idx in long_idx],
+            truncation=True,
+            max_length=RERANK_MAX_TOKENS,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+        )
+        for idx, offsets in zip(long_idx, encoded["offset_mapping"]):
+            if len(offsets) >= RERANK_MAX_TOKENS:
+                rerank_docs[idx] = texts[idx][: offsets[-1][1]]
+            _TRUNCATE_CACHE[texts[idx]] = rerank_docs[idx]
+        while len(_TRUNCATE_CACHE) > TRUNCATE_CACHE_SIZE:
+            _TRUNCATE_CACHE.popitem(last=False)
     # Rerank.
     try:
         if not auth:
             auth = get_chutes_token()
-        result = requests.post(
-            "https://chutes-baai-bge-reranker-large.chutes.ai/rerank",
-            json=dict(
-                query=query,
-                texts=rerank_docs,
-            ),
-            headers={"Authorization": auth},
-        )
-        ranks = result.json()
-        result.raise_for_status()
+        async with RERANK_SM.get_session() as session:
+            async with session.post(
+                "/rerank",
+                json=dict(
+                    query=query,
+                    texts=rerank_docs,
+                ),
+                headers={"Authorization": auth},
+                **({"timeout": timeout} if timeout else {}),
+            ) as resp:
+                ranks = json.loads(await resp.read())
         return "\n---\n".join([texts[ranks[idx]["index"]] for idx in range(min(top_n, len(ranks)))])
     except Exception as exc:
         logger.warning(f"Error running rerank: {exc}\n{traceback.format_exc()}")
@@ -218,18 +386,19 @@ async def contains_nsfw(media_bytes, content_type):
     """
     Check if the target media has NSFW content.
     """
-    base_enc = base64.b64encode(media_bytes).decode()
+    # Base64 output never needs JSON escaping, so build the body directly from bytes.
+    payload = b'{"image_b64":"' + base64.b64encode(media_bytes) + b'"}'
     if not content_type.startswith("image/"):
         logger.info("TODO: video NSFW check")
     try:
         async with NSFW_SM.get_session() as session:
             async with session.post(
                 "/image",
-                headers={"Authorization": get_chutes_token()},
-                json={"image_b64": base_enc},
+                headers={"Authorization": get_chutes_token(), "Content-Type": "application/json"},
+                data=payload,
                 timeout=10.0,
             ) as resp:
-                result = await resp.json()
+                result = json.loads(await resp.read())
                 if result.get("label") == "nsfw":
                     logger.warning(f"Detected NSFW content: {result}")
                     return True
@@ -239,8 +408,15 @@ async def contains_nsfw(media_bytes, content_type):
     return False
 
 
+_NOW_STR = [0, ""]
+
+
 def now_str():
-    return datetime.datetime.now().isoformat()
+    # Second granularity, formatted once per second.
+    now = int(time.time())
+    if now != _NOW_STR[0]:
+        _NOW_STR[:] = [now, datetime.datetime.fromtimestamp(now).isoformat()]
+    return _NOW_STR[1]
 
 
 async def validate_logo(logo_id: str):
@@ -250,12 +426,20 @@ async def validate_logo(logo_id: str):
     if not logo_id:
         return
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://logos.chutes.ai/logo/{logo_id}.webp") as resp:
-                resp.raise_for_status()
-                image_bytes = await resp.read()
-                if await contains_nsfw(image_bytes, "image/webp"):
-                    raise ValueError("Image contains NSFW!")
+        async with LOGO_SM.get_session() as session:
+            async with session.get(f"/logo/{logo_id}.webp") as resp:
+                if (resp.content_length or 0) > MAX_LOGO_BYTES:
+                    raise ValueError(f"Logo exceeds {MAX_LOGO_BYTES} bytes")
+                chunks, size = [], 0
+                async for chunk in resp.content.iter_chunked(65536):
+                    size += len(chunk)
+                    if size > MAX_LOGO_BYTES:
+                        raise ValueError(f"Logo exceeds {MAX_LOGO_BYTES} bytes")
+                    chunks.append(chunk)
+                image_bytes = b"".join(chunks)
+        # Connection is released back to the pool before the (slow) NSFW check.
+        if await contains_nsfw(image_bytes, "image/webp"):
+            raise ValueError("Image contains NSFW!")
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
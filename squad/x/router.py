@@ -3,28 +3,40 @@ Router for X interactions.
 """
 
 import time
+import asyncio
 import hashlib
+import weakref
 import tweepy
-import secrets
+from tweepy.asynchronous import AsyncClient
+import os
 import magic
 import mimetypes
 import aiohttp
+import orjson as json
 import pybase64 as base64
 from loguru import logger
 from typing import Optional
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, HTTPException, status, Request, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, status, Request, File, UploadFile, Header
 from fastapi.responses import RedirectResponse
 from squad.auth import get_current_agent
 from squad.config import settings
-from squad.util import encrypt, decrypt, contains_hate_speech, contains_nsfw
+from squad.aiosession import SessionManager
+from squad.util import encrypt_many, decrypt, contains_hate_speech, contains_nsfw
 from squad.database import get_db_session
 from squad.agent.schemas import Agent
 
 router = APIRouter()
 
+# Shared keep-alive session for X API calls (including tweepy's); non-2xx responses
+# are handled per call, and by tweepy itself.
+X_SM = SessionManager(raise_for_status=False)
+
+# Loading the magic database is expensive, so do it once (from_buffer is lock-guarded).
+_MAGIC = magic.Magic(mime=True)
+
 MEDIA_CATEGORIES = {"image": "tweet_image", "gif": "tweet_gif", "video": "tweet_video"}
 SUPPORTED_IMAGE_TYPES = [
     "image/jpeg",
@@ -37,6 +49,30 @@ SUPPORTED_IMAGE_TYPES = [
 ]
 SUPPORTED_GIF_TYPES = ["image/gif"]
 SUPPORTED_VIDEO_TYPES = ["video/mp4"]
+_MIME_TO_CATEGORY = {
+    **{t: MEDIA_CATEGORIES["image"] for t in SUPPORTED_IMAGE_TYPES},
+    **{t: MEDIA_CATEGORIES["gif"] for t in SUPPORTED_GIF_TYPES},
+    **{t: MEDIA_CATEGORIES["video"] for t in SUPPORTED_VIDEO_TYPES},
+}
+
+# Largest accepted upload request body (videos, plus some multipart framing overhead).
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024 + 64 * 1024
+APPEND_CONCURRENCY = 8
+SIMPLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+X_TOKEN_CACHE_MARGIN = 60
+X_TOKEN_URL = "https://api.x.com/2/oauth2/token"
+_REFRESH_LOCKS = weakref.WeakValueDictionary()
+
+# Leading magic numbers for the supported binary types; when the declared content type
+# matches the file signature, the (much slower) libmagic sniff isn't needed.
+_SIGNATURES = {
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/jpg": (b"\xff\xd8\xff",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/gif": (b"GIF87a", b"GIF89a"),
+    "image/bmp": (b"BM",),
+    "image/tiff": (b"II*\x00", b"MM\x00*"),
+}
 SCOPE = [
     "tweet.read",
     "tweet.write",
@@ -87,22 +123,56 @@ async def determine_media_category(content_type: str, filename: str = None) -> s
                 detail=f"Could not determine content type from filename: {filename}",
             )
     content_type = content_type.lower()
-    if any(content_type.startswith(t) for t in SUPPORTED_IMAGE_TYPES):
-        return MEDIA_CATEGORIES["image"]
-    elif any(content_type == t for t in SUPPORTED_GIF_TYPES):
-        return MEDIA_CATEGORIES["gif"]
-    elif any(content_type.startswith(t) for t in SUPPORTED_VIDEO_TYPES):
-        return MEDIA_CATEGORIES["video"]
+    # Ignore any parameters (e.g. "; charset=..."), which the old prefix match tolerated.
+    media_category = _MIME_TO_CATEGORY.get(content_type.split(";", 1)[0].strip())
+    if media_category:
+        return media_category
     raise HTTPException(status_code=400, detail=f"Unsupported media type: {content_type}")
 
 
-def oauth_handler():
-    return tweepy.OAuth2UserHandler(
-        client_id=settings.x_client_id,
-        redirect_uri=settings.x_api_callback_url,
-        scope=SCOPE,
-        client_secret=settings.x_client_secret,
-    )
+def _signature_matches(content_type: str, sample: bytes) -> bool:
+    """
+    Check if the sample's file signature confirms the client-provided content type.
+    """
+    content_type = (content_type or "").lower()
+    if content_type == "image/webp":
+        return sample[:4] == b"RIFF" and sample[8:12] == b"WEBP"
+    if content_type == "video/mp4":
+        return sample[4:8] == b"ftyp"
+    return sample.startswith(_SIGNATURES.get(content_type, ()))
+
+
+def _token_headers() -> dict:
+    """
+    Headers for the OAuth2 token endpoint (confidential client, basic auth).
+    """
+    client_credentials = f"{settings.x_client_id}:{settings.x_client_secret}"
+    client_credentials_b64 = base64.b64encode(client_credentials.encode()).decode()
+    return {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Authorization": f"Basic {client_credentials_b64}",
+    }
+
+
+async def _refresh_x_token(refresh_token: str) -> dict:
+    """
+    Exchange a refresh token for a new token pair, over the shared X session.
+    """
+    data = {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+        "client_id": settings.x_client_id,
+    }
+    async with X_SM.get_session() as session:
+        async with session.post(X_TOKEN_URL, headers=_token_headers(), data=data) as response:
+            if not 200 <= response.status < 300:
+                error_text = await response.text()
+                logger.warning(f"Token refresh failed: {response.status} - {error_text}")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=f"Failed to refresh X access token: {error_text}",
+                )
+            return json.loads(await response.read())
 
 
 class UserActionRequest(BaseModel):
@@ -120,10 +190,11 @@ class QuoteTweetRequest(BaseModel):
 
 @router.get("/auth")
 async def get_oauth_url(redirect_path: Optional[str] = None):
-    code_verifier = secrets.token_urlsafe(64)
-    code_challenge_bytes = hashlib.sha256(code_verifier.encode()).digest()
-    code_challenge = base64.urlsafe_b64encode(code_challenge_bytes).decode().rstrip("=")
-    state = secrets.token_urlsafe(16)
+    code_verifier = base64.urlsafe_b64encode(os.urandom(48)).rstrip(b"=").decode("ascii")
+    # A 32-byte digest always encodes to 44 chars with exactly one "=" of padding.
+    code_challenge_bytes = hashlib.sha256(code_verifier.encode("ascii")).digest()
+    code_challenge = base64.urlsafe_b64encode(code_challenge_bytes)[:-1].decode("ascii")
+    state = base64.urlsafe_b64encode(os.urandom(12)).decode("ascii")
     auth_url = (
         "https://x.com/i/oauth2/authorize"
         "?response_type=code"
@@ -182,21 +253,14 @@ async def oauth_callback(
     if isinstance(code_verifier, bytes):
         code_verifier = code_verifier.decode()
     try:
-        token_url = "https://api.x.com/2/oauth2/token"
-        client_credentials = f"{settings.x_client_id}:{settings.x_client_secret}"
-        client_credentials_b64 = base64.b64encode(client_credentials.encode()).decode()
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Authorization": f"Basic {client_credentials_b64}",
-        }
         data = {
             "code": code,
             "grant_type": "authorization_code",
             "redirect_uri": settings.x_api_callback_url,
             "code_verifier": code_verifier,
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(token_url, headers=headers, data=data) as response:
+        async with X_SM.get_session() as session:
+            async with session.post(X_TOKEN_URL, headers=_token_headers(), data=data) as response:
                 if not 200 <= response.status < 300:
                     error_text = await response.text()
                     logger.warning(f"Token request failed: {response.status} - {error_text}")
@@ -204,9 +268,14 @@ async def oauth_callback(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail=f"Failed to fetch access token: {error_text}",
                     )
-                access_token = await response.json()
-        client = tweepy.Client(access_token["access_token"])
-        user = client.get_me(user_auth=False)
+                access_token = json.loads(await response.read())
+        # The agent lookup needs the username from get_me, but encrypting the new tokens
+        # (a DB round trip) is independent, so overlap it with the X API call.
+        client = await _x_client(access_token["access_token"])
+        user, (encrypted_access, encrypted_refresh) = await asyncio.gather(
+            client.get_me(user_auth=False),
+            encrypt_many([access_token["access_token"], access_token["refresh_token"]]),
+        )
         user_id = str(user.data.id)
         x_username = user.data.username
         agent = (
@@ -221,14 +290,16 @@ async def oauth_callback(
                 detail=f"No agent found for X user ID {user_id}. Please ensure an agent profile exists with this X user ID before authenticating.",
             )
         agent.x_user_id = user_id
-        agent.x_access_token = await encrypt(access_token["access_token"])
-        agent.x_refresh_token = await encrypt(access_token["refresh_token"])
+        agent.x_access_token, agent.x_refresh_token = encrypted_access, encrypted_refresh
         try:
             agent.x_token_expires_at = access_token["expires_at"]
         except Exception:
             agent.x_token_expires_at = time.time() + access_token["expires_in"]
         await db.commit()
         await db.refresh(agent)
+        await cache_access_token(
+            agent.agent_id, access_token["access_token"], agent.x_token_expires_at
+        )
         logger.info(
             f"Successfully authenticated and updated tokens for agent {agent.agent_id} (X User ID: {user_id})"
         )
@@ -242,33 +313,93 @@ async def oauth_callback(
     return RedirectResponse(url=f"{settings.squad_base_url}/{redirect_path.lstrip('/')}")
 
 
-async def get_agent_x_client(db: AsyncSession, agent: Agent):
+async def _x_client(access_token: str) -> AsyncClient:
+    """
+    Non-blocking tweepy client, using the shared X session.
+    """
+    async with X_SM.get_session() as session:
+        client = AsyncClient(access_token)
+        client.session = session
+        return client
+
+
+async def cache_access_token(agent_id: str, access_token: str, expires_at: int):
+    """
+    Cache the decrypted access token until shortly before it expires.
+    """
+    ttl = int(expires_at - time.time()) - X_TOKEN_CACHE_MARGIN
+    if ttl > 0:
+        await settings.redis_client.set(f"xtok:{agent_id}", access_token, ex=ttl)
+
+
+async def get_access_token(db: AsyncSession, agent: Agent) -> str:
+    """
+    Get the agent's (decrypted) X access token, refreshing it if expired.
+    """
+    cached = await settings.redis_client.get(f"xtok:{agent.agent_id}")
+    if cached:
+        return cached.decode() if isinstance(cached, bytes) else cached
     if not agent.x_access_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="User not authenticated"
         )
 
     if time.time() > agent.x_token_expires_at:
-        # Reload agent.
-        agent = (
-            (await db.execute(select(Agent).where(Agent.agent_id == agent.agent_id)))
-            .unique()
-            .scalar_one_or_none()
-        )
-        oauth = oauth_handler()
-        new_token = oauth.refresh_token(
-            token_url="https://api.x.com/2/oauth2/token",
-            client_id=settings.x_client_id,
-            client_secret=settings.x_client_secret,
-            refresh_token=await decrypt(agent.x_refresh_token),
-        )
-        agent.x_access_token = await encrypt(new_token["access_token"])
-        agent.x_refresh_token = await encrypt(new_token["refresh_token"])
-        agent.x_token_expires_at = new_token["expires_at"]
-        await db.commit()
-        await db.refresh(agent)
+        # X rotates refresh tokens on use, so only one refresh per agent may run; anything
+        # that waited on it re-checks the cache/agent rather than replaying the old token.
+        lock = _REFRESH_LOCKS.get(agent.agent_id)
+        if lock is None:
+            lock = _REFRESH_LOCKS[agent.agent_id] = asyncio.Lock()
+        async with lock:
+            cached = await settings.redis_client.get(f"xtok:{agent.agent_id}")
+            if cached:
+                return cached.decode() if isinstance(cached, bytes) else cached
+            # Reload the agent, row locked so refreshes in other workers wait for this one.
+            agent = (
+                (
+                    await db.execute(
+                        select(Agent)
+                        .where(Agent.agent_id == agent.agent_id)
+                        .with_for_update(of=Agent)
+                        .execution_options(populate_existing=True)
+                    )
+                )
+                .unique()
+                .scalar_one_or_none()
+            )
+            if time.time() > agent.x_token_expires_at:
+                refresh_token = await decrypt(agent.x_refresh_token)
+                new_token = await _refresh_x_token(refresh_token)
+                access_token = new_token["access_token"]
+                expires_at = int(time.time()) + new_token["expires_in"]
+                encrypted_access, encrypted_refresh = await encrypt_many(
+                    [access_token, new_token.get("refresh_token", refresh_token)]
+                )
+                # Single UPDATE (synchronized onto the loaded agent); we already hold the
+                # plaintext access token, so neither a re-SELECT nor a decrypt is needed.
+                await db.execute(
+                    update(Agent)
+                    .where(Agent.agent_id == agent.agent_id)
+                    .values(
+                        x_access_token=encrypted_access,
+                        x_refresh_token=encrypted_refresh,
+                        x_token_expires_at=expires_at,
+                    )
+                )
+                await db.commit()
+            else:
+                # Already refreshed elsewhere; release the row lock.
+                await db.commit()
+                access_token = await decrypt(agent.x_access_token)
+    else:
+        access_token = await decrypt(agent.x_access_token)
+
+    await cache_access_token(agent.agent_id, access_token, agent.x_token_expires_at)
+    return access_token
+
 
-    return tweepy.Client(await decrypt(agent.x_access_token))
+async def get_agent_x_client(db: AsyncSession, agent: Agent):
+    return await _x_client(await get_access_token(db, agent))
 
 
 @router.post("/media")
@@ -276,20 +407,28 @@ async def upload_media(
     file: UploadFile = File(...),
     agent: Agent = Depends(get_current_agent(scopes=["x"])),
     db: AsyncSession = Depends(get_db_session),
+    content_length: Optional[int] = Header(None),
 ):
-    await get_agent_x_client(db, agent)
+    # Reject oversized bodies based on the declared length, before any other work.
+    if content_length and content_length > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Media file size exceeds the 512MB limit",
+        )
 
-    # Get file content and determine size
-    file_content = await file.read()
-    total_bytes = len(file_content)
+    # The upload is already spooled to disk by starlette, so only read what's needed
+    # rather than loading the entire file (up to 512MB) into memory.
+    total_bytes = file.size
 
     # Detect content type.
     content_type = file.content_type
 
-    sample = file_content[:2048]
-    detected_mime = magic.Magic(mime=True).from_buffer(sample)
-    if detected_mime and detected_mime != "application/octet-stream":
-        content_type = detected_mime
+    sample = await file.read(2048)
+    await file.seek(0)
+    if not _signature_matches(content_type, sample):
+        detected_mime = _MAGIC.from_buffer(sample)
+        if detected_mime and detected_mime != "application/octet-stream":
+            content_type = detected_mime
     media_category = await determine_media_category(content_type, file.filename)
 
     if media_category == "tweet_image" and total_bytes > 5 * 1024 * 1024:
@@ -298,116 +437,185 @@ async def upload_media(
         return {"error": "GIF file size exceeds the 15MB limit"}
     elif media_category == "tweet_video" and total_bytes > 512 * 1024 * 1024:
         return {"error": "Video file size exceeds the 512MB limit"}
-    await file.seek(0)
 
-    # NSFW?
-    if await contains_nsfw(file_content, content_type):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Media appears to contain NSFW content.",
-        )
+    # Only refresh/check the agent's X credentials once the media itself is acceptable.
+    access_token = await get_access_token(db, agent)
+
+    # NSFW? (the classifier handles images only, so videos are never read fully)
+    # Still images are small and checked up front; GIFs (up to 15MB) are checked while the
+    # upload runs, and the media is only finalized if the check passes.
+    nsfw_task = None
+    if media_category == "tweet_image":
+        is_nsfw = await contains_nsfw(await file.read(), content_type)
+        await file.seek(0)
+        if is_nsfw:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Media appears to contain NSFW content.",
+            )
+    elif media_category == "tweet_gif":
+        nsfw_task = asyncio.create_task(contains_nsfw(await file.read(), content_type))
+        await file.seek(0)
 
-    # Use the agent's X access token.
-    access_token = await decrypt(agent.x_access_token)
     headers = {"Authorization": f"Bearer {access_token}"}
-    async with aiohttp.ClientSession() as session:
-        # INIT required to get a media ID to use.
-        init_data = {
-            "command": "INIT",
-            "total_bytes": str(total_bytes),
-            "media_type": content_type,
-            "media_category": media_category,
-        }
-        async with session.post(
-            "https://api.twitter.com/2/media/upload", data=init_data, headers=headers
-        ) as init_response:
-            if not 200 <= init_response.status < 300:
-                error_text = await init_response.text()
-                return {"error": f"Failed to initialize media upload: {error_text}"}
-            init_result = await init_response.json()
-            media_id = init_result.get("data", {}).get("id")
-            if not media_id:
-                return {"error": "Failed to get media_id from initialization"}
-
-        # Now upload the actual media via APPEND, either single post or chunked.
-        CHUNK_SIZE = 5 * 1024 * 1024
-        if total_bytes <= CHUNK_SIZE:
-            form_data = aiohttp.FormData()
-            form_data.add_field("command", "APPEND")
-            form_data.add_field("media_id", media_id)
-            form_data.add_field("segment_index", "0")
-            form_data.add_field(
-                "media", file_content, filename=file.filename, content_type=content_type
-            )
+    try:
+        async with X_SM.get_session() as session:
+            # Small still images can be sent in one (non-chunked) request, skipping INIT/FINALIZE.
+            if media_category == "tweet_image" and total_bytes <= SIMPLE_UPLOAD_MAX_BYTES:
+                form_data = aiohttp.FormData()
+                form_data.add_field("media_category", media_category)
+                form_data.add_field(
+                    "media", await file.read(), filename=file.filename, content_type=content_type
+                )
+                async with session.post(
+                    "https://api.twitter.com/2/media/upload",
+                    data=form_data,
+                    headers=headers,
+                ) as upload_response:
+                    if not 200 <= upload_response.status < 300:
+                        error_text = await upload_response.text()
+                        return {"error": f"Failed to upload media: {error_text}"}
+                    upload_result = json.loads(await upload_response.read()).get("data", {})
+                if not upload_result.get("id"):
+                    return {"error": "Failed to get media_id from upload"}
+                return {
+                    "media_id": upload_result["id"],
+                    "status": "completed",
+                    "expires_after_secs": upload_result.get("expires_after_secs", 86400),
+                }
+
+            # INIT required to get a media ID to use.
+            init_data = {
+                "command": "INIT",
+                "total_bytes": str(total_bytes),
+                "media_type": content_type,
+                "media_category": media_category,
+            }
             async with session.post(
-                "https://api.twitter.com/2/media/upload", data=form_data, headers=headers
-            ) as append_response:
-                if not 200 <= append_response.status < 300:
-                    error_text = await append_response.text()
-                    return {"error": f"Failed to append media: {error_text}"}
-        else:
-            chunks = (total_bytes + CHUNK_SIZE - 1) // CHUNK_SIZE
-            for i in range(chunks):
-                start_byte = i * CHUNK_SIZE
-                end_byte = min((i + 1) * CHUNK_SIZE, total_bytes)
-                chunk_data = file_content[start_byte:end_byte]
+                "https://api.twitter.com/2/media/upload",
+                data=init_data,
+                headers=headers,
+            ) as init_response:
+                if not 200 <= init_response.status < 300:
+                    error_text = await init_response.text()
+                    return {"error": f"Failed to initialize media upload: {error_text}"}
+                init_result = json.loads(await init_response.read())
+                media_id = init_result.get("data", {}).get("id")
+                if not media_id:
+                    return {"error": "Failed to get media_id from initialization"}
+
+            # Now upload the actual media via APPEND, either single post or chunked.
+            CHUNK_SIZE = 5 * 1024 * 1024
+            if total_bytes <= CHUNK_SIZE:
                 form_data = aiohttp.FormData()
                 form_data.add_field("command", "APPEND")
                 form_data.add_field("media_id", media_id)
-                form_data.add_field("segment_index", str(i))
+                form_data.add_field("segment_index", "0")
                 form_data.add_field(
-                    "media", chunk_data, filename=file.filename, content_type=content_type
+                    "media", await file.read(), filename=file.filename, content_type=content_type
                 )
                 async with session.post(
-                    "https://api.twitter.com/2/media/upload", data=form_data, headers=headers
+                    "https://api.twitter.com/2/media/upload",
+                    data=form_data,
+                    headers=headers,
                 ) as append_response:
                     if not 200 <= append_response.status < 300:
                         error_text = await append_response.text()
+                        return {"error": f"Failed to append media: {error_text}"}
+            else:
+                # Segments are independent, so send them concurrently (bounded), reading each
+                # chunk by offset under a lock since the spooled file has a single position.
+                chunks = (total_bytes + CHUNK_SIZE - 1) // CHUNK_SIZE
+                semaphore = asyncio.Semaphore(APPEND_CONCURRENCY)
+                read_lock = asyncio.Lock()
+
+                async def _append_chunk(i):
+                    async with semaphore:
+                        async with read_lock:
+                            await file.seek(i * CHUNK_SIZE)
+                            chunk_data = await file.read(CHUNK_SIZE)
+                        form_data = aiohttp.FormData()
+                        form_data.add_field("command", "APPEND")
+                        form_data.add_field("media_id", media_id)
+                        form_data.add_field("segment_index", str(i))
+                        form_data.add_field(
+                            "media", chunk_data, filename=file.filename, content_type=content_type
+                        )
+                        async with session.post(
+                            "https://api.twitter.com/2/media/upload",
+                            data=form_data,
+                            headers=headers,
+                        ) as append_response:
+                            if not 200 <= append_response.status < 300:
+                                error_text = await append_response.text()
+                                return (
+                                    f"Failed to append media chunk {i + 1}/{chunks}: {error_text}"
+                                )
+                        return None
+
+                results = await asyncio.gather(
+                    *[_append_chunk(i) for i in range(chunks)], return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, BaseException):
+                        return {"error": f"Failed to append media: {result}"}
+                    if result:
+                        return {"error": result}
+
+            # async with session.post(
+            #    "https://api.twitter.com/2/media/upload",
+            #    data=form_data,
+            #    headers=headers
+            # ) as append_response:
+            #    if append_response.status != 200 and append_response.status != 204:
+            #        error_text = await append_response.text()
+            #        return {"error": f"Failed to append media: {error_text}"}
+
+            # Don't finalize (i.e. make usable) media that failed the NSFW check.
+            if nsfw_task and await nsfw_task:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Media appears to contain NSFW content.",
+                )
+
+            # FINALIZE the media upload.
+            finalize_data = {"command": "FINALIZE", "media_id": media_id}
+            async with session.post(
+                "https://api.twitter.com/2/media/upload",
+                data=finalize_data,
+                headers=headers,
+            ) as finalize_response:
+                if not 200 <= finalize_response.status < 300:
+                    error_text = await finalize_response.text()
+                    return {"error": f"Failed to finalize media upload: {error_text}"}
+                finalize_result = json.loads(await finalize_response.read())
+                processing_info = finalize_result.get("data", {}).get("processing_info")
+                if processing_info:
+                    processing_state = processing_info.get("state")
+                    if processing_state == "pending" or processing_state == "in_progress":
+                        return {
+                            "media_id": media_id,
+                            "status": "processing",
+                            "check_after_secs": processing_info.get("check_after_secs", 0),
+                            "progress_percent": processing_info.get("progress_percent", 0),
+                        }
+                    elif processing_state == "failed":
                         return {
-                            "error": f"Failed to append media chunk {i+1}/{chunks}: {error_text}"
+                            "error": "Media processing failed",
+                            "media_id": media_id,
+                            "details": processing_info.get("error", {}),
                         }
+                return {
+                    "media_id": media_id,
+                    "status": "completed",
+                    "expires_after_secs": finalize_result.get("data", {}).get(
+                        "expires_after_secs", 86400
+                    ),
+                }
 
-        # async with session.post(
-        #    "https://api.twitter.com/2/media/upload",
-        #    data=form_data,
-        #    headers=headers
-        # ) as append_response:
-        #    if append_response.status != 200 and append_response.status != 204:
-        #        error_text = await append_response.text()
-        #        return {"error": f"Failed to append media: {error_text}"}
-
-        # FINALIZE the media upload.
-        finalize_data = {"command": "FINALIZE", "media_id": media_id}
-        async with session.post(
-            "https://api.twitter.com/2/media/upload", data=finalize_data, headers=headers
-        ) as finalize_response:
-            if not 200 <= finalize_response.status < 3090:
-                error_text = await finalize_response.text()
-                return {"error": f"Failed to finalize media upload: {error_text}"}
-            finalize_result = await finalize_response.json()
-            processing_info = finalize_result.get("data", {}).get("processing_info")
-            if processing_info:
-                processing_state = processing_info.get("state")
-                if processing_state == "pending" or processing_state == "in_progress":
-                    return {
-                        "media_id": media_id,
-                        "status": "processing",
-                        "check_after_secs": processing_info.get("check_after_secs", 0),
-                        "progress_percent": processing_info.get("progress_percent", 0),
-                    }
-                elif processing_state == "failed":
-                    return {
-                        "error": "Media processing failed",
-                        "media_id": media_id,
-                        "details": processing_info.get("error", {}),
-                    }
-            return {
-                "media_id": media_id,
-                "status": "completed",
-                "expires_after_secs": finalize_result.get("data", {}).get(
-                    "expires_after_secs", 86400
-                ),
-            }
+    finally:
+        if nsfw_task and not nsfw_task.done():
+            nsfw_task.cancel()
 
 
 @router.post("/tweet")
@@ -426,7 +634,7 @@ async def tweet(
     client = await get_agent_x_client(db, agent)
     if not tweet_payload.media_ids:
         tweet_payload.media_ids = None
-    response = client.create_tweet(
+    response = await client.create_tweet(
         text=tweet_payload.text,
         in_reply_to_tweet_id=tweet_payload.in_reply_to,
         media_ids=tweet_payload.media_ids,
@@ -435,6 +643,26 @@ async def tweet(
     return {"tweet_id": response.data["id"]}
 
 
+# X reports repeated actions (already retweeted, duplicate post, ...) as forbidden.
+_REPEATED_ACTION_MARKERS = ("already", "duplicate")
+
+
+def _action_error(exc: tweepy.TweepyException) -> HTTPException:
+    """
+    Map a tweepy error to an HTTP error, using 409 when the action was already performed.
+    """
+    if isinstance(exc, tweepy.HTTPException):
+        response_status = getattr(exc.response, "status", None) or getattr(
+            exc.response, "status_code", None
+        )
+        message = str(exc).lower()
+        if response_status == 409 or (
+            response_status == 403 and any(marker in message for marker in _REPEATED_ACTION_MARKERS)
+        ):
+            return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+
 @router.post("/follow")
 async def follow(
     request: UserActionRequest,
@@ -443,10 +671,10 @@ async def follow(
 ):
     client = await get_agent_x_client(db, agent)
     try:
-        response = client.follow_user(request.user_id, user_auth=False)
+        response = await client.follow_user(request.user_id, user_auth=False)
         return {"success": True, "following": response.data["following"]}
     except tweepy.TweepyException as exc:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        raise _action_error(exc)
 
 
 @router.post("/like")
@@ -457,10 +685,10 @@ async def like(
 ):
     client = await get_agent_x_client(db, agent)
     try:
-        response = client.like(request.tweet_id, user_auth=False)
+        response = await client.like(request.tweet_id, user_auth=False)
         return {"success": True, "liked": response.data["liked"]}
     except tweepy.TweepyException as exc:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        raise _action_error(exc)
 
 
 @router.post("/retweet")
@@ -471,10 +699,10 @@ async def retweet(
 ):
     client = await get_agent_x_client(db, agent)
     try:
-        response = client.retweet(request.tweet_id, user_auth=False)
+        response = await client.retweet(request.tweet_id, user_auth=False)
         return {"success": True, "retweeted": response.data["retweeted"]}
     except tweepy.TweepyException as exc:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        raise _action_error(exc)
 
 
 @router.post("/quote")
@@ -490,9 +718,9 @@ async def quote_tweet(
         )
     client = await get_agent_x_client(db, agent)
     try:
-        response = client.create_tweet(
+        response = await client.create_tweet(
             text=request.text, quote_tweet_id=request.tweet_id, user_auth=False
         )
         return {"tweet_id": response.data["id"]}
     except tweepy.TweepyException as exc:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        raise _action_error(exc)